@@ -5,18 +5,45 @@ GameCube games such as Mario Kart: Double Dash!!. Also support for BSFT and BAAC
 BAA format specification was extracted from Jampacked by Xayr (https://github.com/XAYRGA/jampacked).
 """
 import json
+import mmap
 import os
+import shutil
 import struct
 
 from enum import IntEnum
 
+_U32 = struct.Struct('>I')
+_u32_unpack = _U32.unpack
+_u32_pack = _U32.pack
+
 
 def _read_uint32(f):
-    return struct.unpack(">I", f.read(4))[0]
+    return _u32_unpack(f.read(4))[0]
 
 
 def _write_uint32(f, value):
-    f.write(struct.pack(">I", value))
+    f.write(_u32_pack(value))
+
+
+def _write_buffers(f, buffers: list[bytes]):
+    if not hasattr(os, 'writev'):
+        f.write(b''.join(buffers))
+        return
+
+    # Let the kernel gather the buffers, as opposed to concatenating them first. writev() may
+    # write fewer bytes than requested, and accepts a limited number of buffers per call.
+    f.flush()
+    fd = f.fileno()
+    iov_max = max(os.sysconf('SC_IOV_MAX'), 16)
+    views = [memoryview(buffer) for buffer in buffers if buffer]
+    index = 0
+    while index < len(views):
+        written = os.writev(fd, views[index:index + iov_max])
+        while index < len(views) and written >= len(views[index]):
+            written -= len(views[index])
+            index += 1
+        if written:
+            views[index] = views[index][written:]
 
 
 def _prepare_destination_directory(dirpath: str):
@@ -32,7 +59,8 @@ def _prepare_destination_directory(dirpath: str):
 
 
 def _aligned(value: int, alignment: int) -> int:
-    return (value | alignment - 1) + 1 if value % alignment else value
+    # Only valid for power-of-two alignments.
+    return (value + alignment - 1) & ~(alignment - 1)
 
 
 class _SectionType(IntEnum):
@@ -47,6 +75,9 @@ class _SectionType(IntEnum):
     WSYS = 0x77732020  # WAVE SYSTEM
 
 
+# Plain dictionary lookups are considerably cheaper than calling the enum type.
+_INT_TO_SECTION_TYPE = {section_type.value: section_type for section_type in _SectionType}
+
 _FILE_EXTENSIONS = {
     _SectionType.BAAC: '.baac',
     _SectionType.BFCA: '.bfca',
@@ -59,88 +90,85 @@ _FILE_EXTENSIONS = {
     _SectionType.WSYS: '.wsy',
 }
 
+# Fields that follow the section type in the BAA header, in the order in which they are stored.
+_SECTION_FIELDS = {
+    _SectionType.BAAC: (struct.Struct('>II'), ('start', 'end')),
+    _SectionType.BFCA: (struct.Struct('>I'), ('start',)),
+    _SectionType.BMS: (struct.Struct('>III'), ('number', 'start', 'end')),
+    _SectionType.BNK: (struct.Struct('>II'), ('number', 'start')),
+    _SectionType.BSC: (struct.Struct('>II'), ('start', 'end')),
+    _SectionType.BSFT: (struct.Struct('>I'), ('start',)),
+    _SectionType.BST: (struct.Struct('>II'), ('start', 'end')),
+    _SectionType.BSTN: (struct.Struct('>II'), ('start', 'end')),
+    _SectionType.WSYS: (struct.Struct('>III'), ('number', 'start', 'flags')),
+}
+
+# Enough zeros for the largest section alignment.
+_PADDING = bytes(32)
+
 _BAA_MAGIC = 0x41415F3C
 _BAA_FOOTER = 0x3E5F4141
 
 
-def _parse_baa_header(f) -> list[dict]:
+def _parse_baa_header_buf(buf) -> list[dict]:
     sections = []
 
-    magic = _read_uint32(f)
+    magic = _U32.unpack_from(buf, 0)[0]
     if magic != _BAA_MAGIC:
         raise RuntimeError(f'Bad magic in BAA file: 0x{magic:08X} (expected 0x{_BAA_MAGIC:08X})')
+    pos = 4
 
     while True:
-        section_type = _read_uint32(f)
+        section_type = _U32.unpack_from(buf, pos)[0]
+        pos += 4
         if section_type == _BAA_FOOTER:
             break
 
         try:
-            section_type = _SectionType(section_type)
-        except ValueError as e:
+            section_type = _INT_TO_SECTION_TYPE[section_type]
+        except KeyError as e:
             raise RuntimeError(f'Unexpected file type in BAA file: 0x{section_type:08X}') from e
 
         section = {'type': section_type}
 
-        if section_type == _SectionType.BST:
-            section['start'] = _read_uint32(f)
-            section['end'] = _read_uint32(f)
-        elif section_type == _SectionType.BSTN:
-            section['start'] = _read_uint32(f)
-            section['end'] = _read_uint32(f)
-        elif section_type == _SectionType.WSYS:
-            section['number'] = _read_uint32(f)
-            section['start'] = _read_uint32(f)
-            section['flags'] = _read_uint32(f)
-        elif section_type == _SectionType.BNK:
-            section['number'] = _read_uint32(f)
-            section['start'] = _read_uint32(f)
-        elif section_type == _SectionType.BSC:
-            section['start'] = _read_uint32(f)
-            section['end'] = _read_uint32(f)
-        elif section_type == _SectionType.BMS:
-            section['number'] = _read_uint32(f)
-            section['start'] = _read_uint32(f)
-            section['end'] = _read_uint32(f)
-        elif section_type == _SectionType.BSFT:
-            section['start'] = _read_uint32(f)
-        elif section_type == _SectionType.BFCA:
-            section['start'] = _read_uint32(f)
-        elif section_type == _SectionType.BAAC:
-            section['start'] = _read_uint32(f)
-            section['end'] = _read_uint32(f)
+        fields_struct, field_names = _SECTION_FIELDS[section_type]
+        section.update(zip(field_names, fields_struct.unpack_from(buf, pos)))
+        pos += fields_struct.size
 
         sections.append(section)
 
     return sections
 
 
-def _get_baa_section_size(section: dict, f) -> int:
+def _parse_baa_header(f) -> list[dict]:
+    return _parse_baa_header_buf(f.read())
+
+
+def _get_baa_section_size(section: dict, data) -> int:
     section_type = section['type']
     section_start = section['start']
 
     if section_type == _SectionType.BNK:
-        f.seek(section_start + 4)  # +4 to skip IBNK magic.
-        return _read_uint32(f)
+        return _U32.unpack_from(data, section_start + 4)[0]  # +4 to skip IBNK magic.
 
     if section_type == _SectionType.WSYS:
-        f.seek(section_start + 4)  # +4 to skip WSYS magic.
-        return _read_uint32(f)
+        return _U32.unpack_from(data, section_start + 4)[0]  # +4 to skip WSYS magic.
 
     if section_type == _SectionType.BSFT:
-        f.seek(section_start + 4)  # +4 to skip BSFT magic.
         # The only way to figure out the size is to find the offset to the last string in the table,
         # and check how long that string is.
-        string_count = _read_uint32(f)
-        max_string_offset = 4 + 4 + 4 * string_count  # Magic + count field + offsets table.
-        for _ in range(string_count):
-            string_offset = _read_uint32(f)
-            max_string_offset = max(max_string_offset, string_offset)
+        string_count = _U32.unpack_from(data, section_start + 4)[0]  # +4 to skip BSFT magic.
+        string_offsets = struct.unpack_from(f'>{string_count}I', data, section_start + 4 + 4)
+        max_string_offset = max(
+            4 + 4 + 4 * string_count,  # Magic + count field + offsets table.
+            max(string_offsets, default=0),
+        )
         size = max_string_offset
         if string_count:
-            f.seek(max_string_offset + section_start)
-            while f.read(1) != b'\0':
-                size += 1
+            string_end = data.find(b'\0', max_string_offset + section_start)
+            if string_end < 0:
+                string_end = len(data)
+            size = string_end - section_start
             size += 1  # Null character.
         return size
 
@@ -150,6 +178,13 @@ def _get_baa_section_size(section: dict, f) -> int:
     return section['end'] - section_start
 
 
+def _get_section_filepaths(dirpath: str, section_types: list[_SectionType]) -> list[str]:
+    return [
+        os.path.join(dirpath, f'{i}{_FILE_EXTENSIONS[section_type]}')
+        for i, section_type in enumerate(section_types)
+    ]
+
+
 _INFO_FILE_EXTENSION = '.baa_info.json'
 
 
@@ -159,25 +194,25 @@ def unpack_baa(src_filepath: str, dst_dirpath: str):
 
     _prepare_destination_directory(dst_dirpath)
 
-    with open(src_filepath, 'rb') as f:
-        sections = _parse_baa_header(f)
-
-        for i, section in enumerate(sections):
-            filename = f'{i}{_FILE_EXTENSIONS[section["type"]]}'
-            filepath = os.path.join(dst_dirpath, filename)
-
-            section_size = _get_baa_section_size(section, f)
-            f.seek(section['start'])
-            data = f.read(section_size)
-
+    # The input file is memory-mapped; the header is parsed, and the sections are written, straight
+    # out of the mapping, without seeking or copying.
+    with open(src_filepath, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as baa_data, \
+            memoryview(baa_data) as baa_view:
+        sections = _parse_baa_header_buf(baa_data)
+        filepaths = _get_section_filepaths(dst_dirpath, [section['type'] for section in sections])
+
+        for section, filepath in zip(sections, filepaths):
+            section_start = section['start']
+            section_size = _get_baa_section_size(section, baa_data)
             with open(filepath, 'wb') as output_file:
-                output_file.write(data)
+                output_file.write(baa_view[section_start:section_start + section_size])
 
     stem, _ext = os.path.splitext(os.path.basename(src_filepath))
     filepath = os.path.join(dst_dirpath, f'{stem}{_INFO_FILE_EXTENSION}')
 
     with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(json.dumps(sections, indent=4))
+        json.dump(sections, f, indent=4)
 
 
 def pack_baa(src_dirpath: str, dst_filepath: str):
@@ -206,82 +241,102 @@ def pack_baa(src_dirpath: str, dst_filepath: str):
     with open(src_filepath, 'r', encoding='utf-8') as input_file:
         sections = json.load(input_file)
 
-    with open(dst_filepath, 'wb') as output_file:
-        _write_uint32(output_file, _BAA_MAGIC)
-
-        file_data_blobs = []
-
-        for i, section in enumerate(sections):
-            section_type = _SectionType(section['type'])
-            _write_uint32(output_file, section_type)
-
-            if 'number' in section:
-                _write_uint32(output_file, section['number'])
-
-            start_offset_offset = output_file.tell()
-            _write_uint32(output_file, 0xBAAAAAAD)
-
-            if 'end' in section:
-                end_offset_offset = output_file.tell()
-                _write_uint32(output_file, 0xBAAAAAAD)
-            else:
-                end_offset_offset = None
+    # The header is assembled in memory, where the offset placeholders can be patched cheaply, and
+    # then written to disk in one go.
+    output = bytearray(_u32_pack(_BAA_MAGIC))
+
+    try:
+        section_types = [_INT_TO_SECTION_TYPE[section['type']] for section in sections]
+    except KeyError as e:
+        raise ValueError(f'Unexpected section type in BAA info file: {e.args[0]}') from e
+    filepaths = _get_section_filepaths(src_dirpath, section_types)
+
+    file_data_blobs = []
+
+    for section, section_type, filepath in zip(sections, section_types, filepaths):
+        output += _u32_pack(section_type)
+
+        if 'number' in section:
+            output += _u32_pack(section['number'])
+
+        start_offset_offset = len(output)
+        output += _u32_pack(0xBAAAAAAD)
+
+        if 'end' in section:
+            end_offset_offset = len(output)
+            output += _u32_pack(0xBAAAAAAD)
+        else:
+            end_offset_offset = None
+
+        if 'flags' in section:
+            output += _u32_pack(section['flags'])
+
+        file_data_blobs.append((
+            section['start'],
+            filepath,
+            os.stat(filepath).st_size,
+            start_offset_offset,
+            end_offset_offset,
+            section_type,
+        ))
+
+    output += _u32_pack(_BAA_FOOTER)
+
+    file_data_blobs.sort(key=lambda blob: blob[0])  # Sort by the original start offsets.
+
+    # The layout is determined from the file sizes alone, so that the header can be completed
+    # before any file data is touched; the file data is then streamed to the output file.
+    file_data_layout = []
+    end_offset = len(output)
+
+    for (
+            _original_start_offset,
+            filepath,
+            size,
+            start_offset_offset,
+            end_offset_offset,
+            section_type,
+    ) in file_data_blobs:
+        start_offset = end_offset
+        end_offset = start_offset + size
+
+        _U32.pack_into(output, start_offset_offset, start_offset)
+
+        if end_offset_offset is not None:
+            _U32.pack_into(output, end_offset_offset, end_offset)
+
+        # It was observed in GCKart.baa that certain types are aligned. MKDD does not seem to
+        # care about this alignment, but adding it enables the tool to reconstruct GCKart.baa
+        # identically.
+        if section_type == _SectionType.BNK:
+            alignment = 16
+        elif section_type == _SectionType.WSYS:
+            alignment = 32
+        else:
+            alignment = 0
+        if alignment:
+            padding = _aligned(end_offset, alignment) - end_offset
+            end_offset += padding
+        else:
+            padding = 0
 
-            if 'flags' in section:
-                _write_uint32(output_file, section['flags'])
+        file_data_layout.append((filepath, padding))
 
-            filename = f'{i}{_FILE_EXTENSIONS[section_type]}'
-            filepath = os.path.join(src_dirpath, filename)
+    with open(dst_filepath, 'wb') as output_file:
+        output_file.write(output)
 
+        for filepath, padding in file_data_layout:
             with open(filepath, 'rb') as input_file:
-                data = input_file.read()
-
-            file_data_blobs.append((
-                section['start'],
-                data,
-                start_offset_offset,
-                end_offset_offset,
-                section_type,
-            ))
-
-        _write_uint32(output_file, _BAA_FOOTER)
-
-        file_data_blobs.sort()  # Sort by the original start offsets.
-
-        for (
-                _original_start_offset,
-                data,
-                start_offset_offset,
-                end_offset_offset,
-                section_type,
-        ) in file_data_blobs:
-            start_offset = output_file.tell()
-            output_file.write(data)
-            end_offset = output_file.tell()
-
-            # It was observed in GCKart.baa that certain types are aligned. MKDD does not seem to
-            # care about this alignment, but adding it enables the tool to reconstruct GCKart.baa
-            # identically.
-            if section_type == _SectionType.BNK:
-                alignment = 16
-            elif section_type == _SectionType.WSYS:
-                alignment = 32
-            else:
-                alignment = 0
-            if alignment:
-                padding = _aligned(end_offset, alignment) - end_offset
-                output_file.write(b'\x00' * padding)
-
-            cursor = output_file.tell()
+                shutil.copyfileobj(input_file, output_file, 1024 * 1024)
+            if padding:
+                output_file.write(_PADDING[:padding])
 
-            output_file.seek(start_offset_offset)
-            _write_uint32(output_file, start_offset)
+        written_size = output_file.tell()
 
-            if end_offset_offset is not None:
-                output_file.seek(end_offset_offset)
-                _write_uint32(output_file, end_offset)
-
-            output_file.seek(cursor)
+    if written_size != end_offset:
+        # The header offsets no longer match the data; the corrupt output is not left behind.
+        os.remove(dst_filepath)
+        raise RuntimeError(f'Section files in "{src_dirpath}" changed while being packed')
 
 
 def unpack_baac(src_filepath: str, dst_dirpath: str):
@@ -292,7 +347,7 @@ def unpack_baac(src_filepath: str, dst_dirpath: str):
 
     with open(src_filepath, 'rb') as input_file:
         file_count = _read_uint32(input_file)
-        offsets = tuple(_read_uint32(input_file) for _ in range(file_count))
+        offsets = struct.unpack(f'>{file_count}I', input_file.read(4 * file_count))
 
         filename_padding = len(str(file_count))
 
@@ -316,22 +371,21 @@ def pack_baac(src_filepaths: list[str], dst_filepath: str):
     if not dst_filepath.endswith('.baac'):
         raise ValueError(f'Destination filepath "{dst_filepath}" should use the ".baac" extension.')
 
-    with open(dst_filepath, 'wb') as output_file:
-        _write_uint32(output_file, len(src_filepaths))
+    buffers = []
+    for src_filepath in src_filepaths:
+        with open(src_filepath, 'rb') as input_file:
+            buffers.append(input_file.read())
 
-        for _ in range(len(src_filepaths)):
-            _write_uint32(output_file, 0)  # Offset placeholder; they will be updated.
+    offsets = []
+    offset = 4 + 4 * len(src_filepaths)  # File count + offsets table.
+    for data in buffers:
+        offsets.append(offset)
+        offset += len(data)
 
-        offsets = []
-        for src_filepath in src_filepaths:
-            with open(src_filepath, 'rb') as input_file:
-                data = input_file.read()
-            offsets.append(output_file.tell())
-            output_file.write(data)
+    header = struct.pack(f'>I{len(offsets)}I', len(offsets), *offsets)
 
-        output_file.seek(4)
-        for offset in offsets:
-            _write_uint32(output_file, offset)
+    with open(dst_filepath, 'wb') as output_file:
+        _write_buffers(output_file, [header] + buffers)
 
 
 def read_bsft(src_filepath: str) -> list[tuple[int, str]]:
@@ -342,15 +396,16 @@ def read_bsft(src_filepath: str) -> list[tuple[int, str]]:
         magic = f.read(4)
         assert magic == b'bsft'
         string_count = _read_uint32(f)
-        string_offsets = tuple(_read_uint32(f) for _ in range(string_count))
+        string_offsets = struct.unpack(f'>{string_count}I', f.read(4 * string_count))
+
+        # Strings are sliced out of the whole file, rather than read from the file one by one.
+        f.seek(0)
+        data = f.read()
 
         offsets_and_strings = []
         for string_offset in string_offsets:
-            f.seek(string_offset)
-            string = bytearray()
-            while (value := f.read(1)) != b'\0':
-                string += value
-            offsets_and_strings.append((string_offset, bytes(string).decode(encoding='ascii')))
+            string = data[string_offset:data.index(b'\0', string_offset)]
+            offsets_and_strings.append((string_offset, string.decode(encoding='ascii')))
 
     return offsets_and_strings
 
@@ -363,8 +418,7 @@ def write_bsft(strings: list[str], dst_filepath: str):
         f.write(b'bsft')
         _write_uint32(f, len(strings))
 
-        for _ in range(len(strings)):
-            _write_uint32(f, 0)  # Offset placeholder; it will be updated.
+        f.write(bytes(4 * len(strings)))  # Offset placeholders; they will be updated.
 
         string_offsets = []
         for string in strings:
@@ -373,5 +427,4 @@ def write_bsft(strings: list[str], dst_filepath: str):
             f.write(b'\x00')  # Null character.
 
         f.seek(4 + 4)  # After file magic and string count.
-        for string_offset in string_offsets:
-            _write_uint32(f, string_offset)
+        f.write(struct.pack(f'>{len(string_offsets)}I', *string_offsets))
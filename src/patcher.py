@@ -147,11 +147,13 @@ def patch_audio_waves(audio_waves_tmp_dir: str, baac_filepath: str, iso) -> dict
     export_waves = not os.path.isdir(retail_copy_dirpath)
 
     # Process WSYS/AW files.
+    unpack_jobs = []
     for i, baa_name in NESTED_BAA_NAMES.items():
         wsys_filepath = os.path.join(baac_content_dirpath, f'{i}_BAA_CONTENT', '0.wsy')
         assert os.path.isfile(wsys_filepath)
         wsys_dirpath = os.path.join(parent_dirpath, f'WSYS_{baa_name}')
-        wsystool.unpack_wsys(wsys_filepath, wsys_dirpath, waves_content_dirpath, export_waves)
+        unpack_jobs.append((wsys_filepath, wsys_dirpath, waves_content_dirpath, export_waves))
+    wsystool.unpack_wsys_batch(unpack_jobs)
 
     if export_waves:
         # If this is the first run (i.e. the following directory does not exist), store a copy of
@@ -195,10 +197,12 @@ def patch_audio_waves(audio_waves_tmp_dir: str, baac_filepath: str, iso) -> dict
                 errors_by_file[f'{baa_name}/{filename}'] = errors
 
     # Rebuild WSYS/AW files.
+    pack_jobs = []
     for i, baa_name in NESTED_BAA_NAMES.items():
         wsys_dirpath = os.path.join(parent_dirpath, f'WSYS_{baa_name}')
         wsys_filepath = os.path.join(baac_content_dirpath, f'{i}_BAA_CONTENT', '0.wsy')
-        wsystool.pack_wsys(wsys_dirpath, wsys_filepath, waves_content_dirpath)
+        pack_jobs.append((wsys_dirpath, wsys_filepath, waves_content_dirpath))
+    wsystool.pack_wsys_batch(pack_jobs)
 
     # Inject modified AW files.
     for aw_filename in aw_filenames:
@@ -1,31 +1,47 @@
 import os 
 import time
+import codecs
 import logging
 import tempfile
 import subprocess 
 
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from itertools import chain
-from struct import pack, unpack
+from struct import Struct
 from .yaz0 import decompress, compress_fast, read_uint32, read_uint16
 
 log = logging.getLogger(__name__)
 
-def write_uint32(f, val):
-    f.write(pack(">I", val))
+# Magic, archive size, header size, data offset, data size, data size, 2 unknown ints, node count,
+# node offset, file entry count, file entry offset, string table size, string table offset,
+# 2 unknown ints. Offsets, other than the header size, are relative to 0x20.
+HEADER = Struct(">4sIIIIIIIIIIIIIII")
+# Node type, name offset, name hash, entry count, first entry index
+NODE = Struct(">4sIHHI")
+# File ID, name hash, flags, padding, name offset, data offset (or node index), data size, padding
+FILE_ENTRY = Struct(">HHBBHIII")
+
+def read_file(path, size):
+    # Reads the file with raw OS calls, as the buffered file object is of no use for a single read.
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        chunks = []
+        while size > 0:
+            chunk = os.read(fd, size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+    finally:
+        os.close(fd)
 
-def write_uint16(f, val):
-    f.write(pack(">H", val))
+    return b"".join(chunks)
 
-def write_uint8(f, val):
-    f.write(pack(">B", val))
+ZEROS = bytes(32)
 
 def write_pad32(f):
-    next_aligned_pos = (f.tell() + 0x1F) & ~0x1F
-
-    f.write(b"\x00"*(next_aligned_pos - f.tell()))
-    #log.info(hex(f.tell()))
-    #log.info(hex(next_aligned_pos))
+    f.write(ZEROS[:-f.tell() & 0x1F])
 
 
 class CompressionSetting(object):
@@ -37,28 +53,27 @@ class CompressionSetting(object):
     def run_wszst(self, file):
         if not self.wszst:
             raise RuntimeError("Wszst is not used")
-        handle, abspath = tempfile.mkstemp()
-        os.close(handle)
         filedata = file.getvalue()
-        with open(abspath, "wb") as f:
-            #log.info("writing to", abspath)
+
+        # The input is written through the descriptor returned by mkstemp, rather than reopening
+        # the file by its path.
+        handle, abspath = tempfile.mkstemp()
+        with open(handle, "wb") as f:
             f.write(filedata)
-            f.close()
-        
+
         outpath = abspath+".yaz0_tmp"
         args = ["wszst", "COMPRESS", abspath, "--dest", outpath, "--compr", self.compression_level]
         try:
             subprocess.run(args, check=True)
+            with open(outpath, "rb") as f:
+                compressed_data = f.read()
         except Exception as err:
             log.error("Encountered error, cleaning up...")
-            os.remove(abspath)
             raise 
-            
-        with open(outpath, "rb") as f:
-            compressed_data = f.read()
-            
-        os.remove(abspath)
-        os.remove(outpath)
+        finally:
+            os.remove(abspath)
+            if os.path.exists(outpath):
+                os.remove(outpath)
         
         if len(filedata) >= len(compressed_data):
             return compressed_data 
@@ -152,7 +167,6 @@ class FileListing(object):
     def __str__(self):
         return str(self.__dict__)
     
-DATA = [0]
 
 # Hashing algorithm taken from Gamma and LordNed's WArchive-Tools, hope it works
 def hash_name(name):
@@ -163,64 +177,71 @@ def hash_name(name):
     elif len(name) + 1 >= 3:
         multiplier = 3
 
-    for letter in name:
-        hash = (hash*multiplier) & 0xFFFF
-        hash = (hash + ord(letter)) & 0xFFFF
+    # Iterating over the encoded bytes of ASCII names avoids an ord() call per letter.
+    for code in name.encode("ascii") if name.isascii() else map(ord, name):
+        hash = (hash*multiplier + code) & 0xFFFF
 
     return hash
 
+_shift_jis_encode = codecs.getencoder("shift-jis")
+
+def encode_name(name):
+    # Names are mostly plain ASCII, which Shift-JIS leaves unchanged; the codec is skipped for those.
+    if name.isascii():
+        return name.encode("ascii")
+    return _shift_jis_encode(name)[0]
+
 class StringTable(object):
     def __init__(self):
         self._strings = BytesIO()
         self._stringmap = {}
+        self._hashmap = {}
 
     def write_string(self, string):
         if string not in self._stringmap:
             offset = self._strings.tell()
-            self._strings.write(string.encode("shift-jis"))
-            self._strings.write(b"\x00")
+            self._strings.write(encode_name(string) + b"\x00")
 
             self._stringmap[string] = offset
+            self._hashmap[string] = hash_name(string)
 
     def get_string_offset(self, string):
         return self._stringmap[string]
 
+    def get_hash(self, string):
+        return self._hashmap[string]
+
     def size(self):
         return self._strings.tell()#len(self._strings.getvalue())
 
     def write_to(self, f):
         f.write(self._strings.getvalue())
 
-def stringtable_get_name(f, stringtable_offset, offset):
-    current = f.tell()
-    f.seek(stringtable_offset+offset)
-
-    stringlen = 0
-    while f.read(1) != b"\x00":
-        stringlen += 1
-
-    f.seek(stringtable_offset+offset)
-
-    filename = f.read(stringlen)
+def stringtable_get_name(stringtable, offset):
+    filename = stringtable[offset:stringtable.index(b"\x00", offset)]
     try:
         decodedfilename = filename.decode("shift-jis")
     except:
         log.error(f"filename: {filename}")
         log.error("failed")
         raise
-    f.seek(current)
 
     return decodedfilename
 
 def split_path(path): # Splits path at first backslash encountered
-    for i, char in enumerate(path):
-        if char == "/" or char == "\\":
-            if len(path) == i+1:
-                return path[:i], None
-            else:
-                return path[:i], path[i+1:]
+    slash = path.find("/")
+    backslash = path.find("\\")
+    if slash == -1:
+        i = backslash
+    elif backslash == -1:
+        i = slash
+    else:
+        i = min(slash, backslash)
 
-    return path, None
+    if i == -1:
+        return path, None
+
+    return path[:i], path[i+1:] or None
 
 class Directory(object):
     def __init__(self, dirname, nodeindex=None):
@@ -233,6 +254,22 @@ class Directory(object):
 
     @classmethod
     def from_dir(cls, path, follow_symlinks=False):
+        # The directory tree is scanned first; the files are then read concurrently, as reading
+        # many small files is dominated by the latency of each read rather than by bandwidth.
+        pending_files = []
+        dir = cls._scan_dir(path, follow_symlinks, pending_files)
+
+        if pending_files:
+            with ThreadPoolExecutor() as executor:
+                datas = executor.map(lambda pending: read_file(pending[2], pending[3]),
+                                     pending_files)
+                for (parent, filename, _filepath, _size), data in zip(pending_files, datas):
+                    parent.files[filename] = File(filename, data=data)
+
+        return dir
+
+    @classmethod
+    def _scan_dir(cls, path, follow_symlinks, pending_files):
         dirname = os.path.basename(path)
         log.debug(f"{dirname} {path}")
         dir = cls(dirname)
@@ -241,21 +278,20 @@ class Directory(object):
         for entry in os.scandir(path):
             log.debug(f"{entry.path} {dirname}")
             if entry.is_dir(follow_symlinks=follow_symlinks):
-                newdir = Directory.from_dir(entry.path, follow_symlinks=follow_symlinks)
+                newdir = cls._scan_dir(entry.path, follow_symlinks, pending_files)
                 dir.subdirs[entry.name] = newdir
                 newdir.parent = dir
 
             elif entry.is_file(follow_symlinks=follow_symlinks):
-                with open(entry.path, "rb") as f:
-                    file = File.from_file(entry.name, f)
-                dir.files[entry.name] = file
+                size = entry.stat(follow_symlinks=follow_symlinks).st_size
+                pending_files.append((dir, entry.name, entry.path, size))
 
         return dir
 
 
 
     @classmethod
-    def from_node(cls, f, _name, stringtable_offset, globalentryoffset, dataoffset, nodelist, currentnodeindex, parents=None):
+    def from_node(cls, f, _name, stringtable, globalentryoffset, dataoffset, nodelist, currentnodeindex, parents=None):
         log.debug("=============================")
         log.debug(f"Creating new node with index {currentnodeindex}")
         name, unknown, entrycount, entryoffset = nodelist[currentnodeindex]
@@ -264,19 +300,19 @@ class Directory(object):
 
         newdir = cls(name, currentnodeindex)
 
-        firstentry = globalentryoffset+entryoffset
+        firstentry = globalentryoffset + entryoffset*FILE_ENTRY.size
         log.debug(f"Node {currentnodeindex} {name} {entrycount} {entryoffset}")
-        log.debug(f"offset {f.tell()}")
-        for i in range(entrycount):
-            offset = globalentryoffset + (entryoffset+i)*20
-            f.seek(offset)
+        log.debug(f"offset {hex(firstentry)}")
 
-            fileentry_data = f.read(20)
+        # All the entries of the node are read in one go.
+        f.seek(firstentry)
+        entries_data = f.read(entrycount*FILE_ENTRY.size)
 
-            fileid, hashcode, flags, padbyte, nameoffset, filedataoffset, datasize, padding = unpack(">HHBBHIII", fileentry_data)
-            log.debug(f"offset {hex(firstentry+i*20)} {fileid} {flags} {nameoffset}")
+        for i, fileentry in enumerate(FILE_ENTRY.iter_unpack(entries_data)):
+            fileid, hashcode, flags, padbyte, nameoffset, filedataoffset, datasize, padding = fileentry
+            log.debug(f"offset {hex(firstentry+i*FILE_ENTRY.size)} {fileid} {flags} {nameoffset}")
 
-            name = stringtable_get_name(f, stringtable_offset, nameoffset)
+            name = stringtable_get_name(stringtable, nameoffset)
 
             log.debug(f"name {name} {fileid}")
 
@@ -289,7 +325,6 @@ class Directory(object):
                 #nodeindex, datasize, padding = unpack(">III", fileentrydata)
                 nodeindex = filedataoffset
 
-                name = stringtable_get_name(f, stringtable_offset, nameoffset)
                 log.debug(f"{name} {hashcode} {hash_name(name)}")
 
 
@@ -303,7 +338,7 @@ class Directory(object):
                     log.warning(f"Skipping")
                     continue
 
-                subdir = Directory.from_node(f, name, stringtable_offset, globalentryoffset, dataoffset, nodelist, nodeindex, parents=newparents)
+                subdir = Directory.from_node(f, name, stringtable, globalentryoffset, dataoffset, nodelist, nodeindex, parents=newparents)
                 subdir.parent = newdir
 
                 newdir.subdirs[subdir.name] = subdir
@@ -314,13 +349,18 @@ class Directory(object):
                     log.info("File is compressed")
                 if flags & YAZ0:
                     log.info("File is yaz0 compressed")
-                f.seek(offset)
-                file = File.from_fileentry(f, stringtable_offset, dataoffset, fileid, hashcode, flags, nameoffset, filedataoffset, datasize)
+                file = File.from_fileentry(f, stringtable, dataoffset, fileid, hashcode, flags, nameoffset, filedataoffset, datasize)
                 newdir.files[file.name] = file
 
         return newdir
 
     def walk(self, _path=None):
+        for dir, dirpath, subdirnames, filenames in self.walk_with_dir(_path):
+            yield (dirpath, subdirnames, filenames)
+
+    def walk_with_dir(self, _path=None):
+        # Like walk(), but the directory object is yielded too, so that callers don't need to look
+        # it up again by its path.
         if _path is None:
             dirpath = self.name
         else:
@@ -328,11 +368,11 @@ class Directory(object):
 
         log.debug(f"Yielding {dirpath}")
 
-        yield (dirpath, self.subdirs.keys(), self.files.keys())
+        yield (self, dirpath, self.subdirs.keys(), self.files.keys())
 
         for dirname, dir in self.subdirs.items():
             log.debug(f"yielding subdir {dirname}")
-            yield from dir.walk(dirpath)
+            yield from dir.walk_with_dir(dirpath)
 
     def __getitem__(self, path):
         name, rest = split_path(path)
@@ -395,17 +435,17 @@ class Directory(object):
             dir.extract_to(current_dirpath)
     
     def absolute_path(self):
-        name = self.name
+        names = [self.name]
         parent = self.parent
         while parent is not None:
-            name = parent.name+"/"+name 
+            names.append(parent.name)
             parent = parent.parent 
         
-        return name
+        return "/".join(reversed(names))
 
 class File(BytesIO):
-    def __init__(self, filename, fileid=None, hashcode=None, flags=None):
-        super().__init__()
+    def __init__(self, filename, fileid=None, hashcode=None, flags=None, data=b""):
+        super().__init__(data)
 
         self.name = filename
         self._fileid = fileid
@@ -416,40 +456,26 @@ class File(BytesIO):
         else:
             self.filetype = FileListing.default()
     def is_yaz0_compressed(self):
-        if self._flags & COMPRESSED and not self._flags & YAZ0:
+        if self.filetype.is_compressed and not self.filetype.is_yaz0:
             log.warning(f"Warning, file {self.name} is compressed but not with yaz0!")
-        return self.filetype.compressed and self.filetype.yaz0
+        return self.filetype.is_compressed and self.filetype.is_yaz0
     
     @classmethod
-    def from_file(cls, filename, f):
-        file = cls(filename)
-
-        file.write(f.read())
-        file.seek(0)
-
-        return file
-
-    @classmethod
-    def from_fileentry(cls, f, stringtable_offset, globaldataoffset, fileid, hashcode, flags, nameoffset, filedataoffset, datasize):
-        filename = stringtable_get_name(f, stringtable_offset, nameoffset)
+    def from_fileentry(cls, f, stringtable, globaldataoffset, fileid, hashcode, flags, nameoffset, filedataoffset, datasize):
+        filename = stringtable_get_name(stringtable, nameoffset)
         log.debug(f"-----")
         log.debug(f'"File": {len(filename)}')
         log.debug(f'"size": {datasize}')
-        log.debug(f'{hex(stringtable_offset)} {hex(nameoffset)}')
+        log.debug(f'{hex(nameoffset)}')
         log.debug(f'{hex(datasize)}')
 
-        file = cls(filename, fileid, hashcode, flags)
-
         f.seek(globaldataoffset+filedataoffset)
-        file.write(f.read(datasize))
-        DATA[0] += datasize
-        # Reset file position
-        file.seek(0)
+        data = f.read(datasize)
 
-        return file
+        return cls(filename, fileid, hashcode, flags, data)
 
     def dump(self, f):
-        if self.is_yaz0_compressed:
+        if self.is_yaz0_compressed():
             decompress(self, f, suppress_error=True)
         else:
             f.write(self.getvalue())
@@ -502,30 +528,35 @@ class Archive(object):
         node_count = read_uint32(f)
         f.read(8) # Unknown
         file_entry_offset = read_uint32(f) + 0x20
-        f.read(4) # Unknown
+        stringtable_size = read_uint32(f)
         stringtable_offset = read_uint32(f) + 0x20
         f.read(8) # Unknown
         nodes = []
 
+        # Names are looked up in a copy of the whole string table, rather than read from the file
+        # one byte at a time.
+        nodes_offset = f.tell()
+        f.seek(stringtable_offset)
+        stringtable = f.read(stringtable_size)
+        f.seek(nodes_offset)
+
         log.debug(f"Archive has {node_count} total directories")
 
                 
         
         log.debug(f"data offset {hex(data_offset)}")
         for i in range(node_count):
-            nodetype = f.read(4)
-            nodedata = f.read(4+2+2+4)
-            nameoffset, unknown, entrycount, entryoffset = unpack(">IHHI", nodedata)
+            nodetype, nameoffset, unknown, entrycount, entryoffset = NODE.unpack(f.read(NODE.size))
 
             if i == 0:
-                dir_name = stringtable_get_name(f, stringtable_offset, nameoffset)
+                dir_name = stringtable_get_name(stringtable, nameoffset)
             else:
                 dir_name = None 
                 
             nodes.append((dir_name, unknown, entrycount, entryoffset))
 
         rootfoldername = nodes[0][0]
-        newarc.root = Directory.from_node(f, rootfoldername, stringtable_offset, file_entry_offset, data_offset, nodes, 0)
+        newarc.root = Directory.from_node(f, rootfoldername, stringtable, file_entry_offset, data_offset, nodes, 0)
         
         return newarc
 
@@ -588,7 +619,7 @@ class Archive(object):
 
         nodes = BytesIO()
         entries = BytesIO()
-        data = BytesIO()
+        data = bytearray()
 
         nodecount = 1
         entries = 0
@@ -598,7 +629,9 @@ class Archive(object):
         stringtable.write_string("..")
         stringtable.write_string(self.root.name)
 
-        for dir, subdirnames, filenames in self.root.walk():
+        walk_list = list(self.root.walk_with_dir())
+
+        for dir, dirpath, subdirnames, filenames in walk_list:
             nodecount += len(subdirnames)
             entries += len(subdirnames) + len(filenames)
 
@@ -608,27 +641,13 @@ class Archive(object):
             for name in filenames:
                 stringtable.write_string(name)
 
-        f.write(b"RARC")
-        f.write(b"FOO ") # placeholder for filesize
-        write_uint32(f, 0x20)  #Unknown but often 0x20?
-        f.write(b"BAR ") # placeholder for data offset
-        f.write(b"\x00"*16) # 4 unknown ints
-
-        write_uint32(f, nodecount)
-        write_uint32(f, 0x20) # unknown
-        f.write(b"\x00"*4) # 1 unknown ints
-
-        #aligned_file_entry_offset = (0x20 + 44 + (nodecount*16) + 0x1F) & 0x20
-        #write_uint32(f, aligned_file_entry_offset)  # Offset to file entries aligned to multiples of 0x20
-        write_uint32(f, 0xF0F0F0F0)
+        # Every name is in the string table by now, which has also hashed each of them once; the
+        # lookups are bound to locals for the loops below.
+        get_string_offset = stringtable.get_string_offset
+        get_hash = stringtable.get_hash
 
-        f.write(b"\x00"*4) # 1 unknown int
-
-        #aligned_stringtable_offset = aligned_file_entry_offset + ((entries * 20) + 0x1F) & 0x20
-        #write_uint32(f, aligned_stringtable_offset)
-        write_uint32(f, 0xF0F0F0F0)
-
-        f.write(b"\x00"*8) # 2 unknown ints
+        # The header is only written once the layout of the archive is known
+        f.write(bytes(HEADER.size))
 
         node_offset = f.tell()
 
@@ -638,9 +657,7 @@ class Archive(object):
 
         #aligned_data_offset = aligned_stringtable_offset + (stringtable.size() + 0x1F) & 0x20
 
-        for i, dirinfo in enumerate(self.root.walk()):
-            dirpath, dirnames, filenames = dirinfo
-            dir = self[dirpath]
+        for i, (dir, dirpath, dirnames, filenames) in enumerate(walk_list):
             dir._nodeindex = i
 
             dirlist.append(dir)
@@ -648,19 +665,14 @@ class Archive(object):
             if i == 0:
                 nodetype = b"ROOT"
             else:
-                nodetype = dir.name.upper().encode("shift-jis")[:4]
-                if len(nodetype) < 4:
-                    nodetype = nodetype + (b"\x00"*(4 - len(nodetype)))
-
-            f.write(nodetype)
-            write_uint32(f, stringtable.get_string_offset(dir.name))
-            hash = hash_name(dir.name)
+                nodetype = encode_name(dir.name.upper()) # Truncated or padded to 4 bytes
 
             entrycount = len(dirnames) + len(filenames)
-            write_uint16(f, hash)
-            write_uint16(f, entrycount+2)
-
-            write_uint32(f, first_file_entry_index)
+            f.write(NODE.pack(nodetype,
+                              get_string_offset(dir.name),
+                              get_hash(dir.name),
+                              entrycount+2,
+                              first_file_entry_index))
             first_file_entry_index += entrycount + 2 # Each directory has two special entries being the current and the parent directories
 
         write_pad32(f)
@@ -676,8 +688,8 @@ class Archive(object):
             return maxindex + 1
         
         for dir in dirlist:
-            log.debug(f"Hello {dir.absolute_path()}")
             abspath = dir.absolute_path()   
+            log.debug(f"Hello {abspath}")
             files = []
             
             for filename, file in dir.files.items():
@@ -685,64 +697,63 @@ class Archive(object):
             
             files.sort(key=key_compare)            
             
-            
+            entries = []
             for filepath, file in files:
                 filemeta = FileListing.default()
                 if filelisting is not None:
                     if filepath in filelisting:
                         fileid, filemeta = filelisting[filepath]
-                        write_uint16(f, fileid)
                         log.debug(f"found filemeta")
-                    else:
-                        write_uint16(f, fileid)
-                else:
-                    write_uint16(f, fileid)
                 filename = file.name 
-                write_uint16(f, hash_name(filename))
                 log.debug(f"Writing filemeta {str(filemeta)}")
-                write_uint8(f, filemeta.to_flags())
-                write_uint8(f, 0) # padding 
-                #f.write(b"\x11\x00") # Flag for file+padding
-                write_uint16(f, stringtable.get_string_offset(filename))
 
-                filedata_offset = data.tell()
-                write_uint32(f, filedata_offset) # Write file data offset
+                filedata_offset = len(data)
                 
                 if filemeta.is_yaz0 and filemeta.is_compressed:
                     log.debug("so far so gud")
                     if compression_settings.wszst:
                         log.debug("doing wszst thing")
-                        compressed_data = compression_setting.run_wszst(file)
-                        data.write(compressed_data)
+                        filedata = compression_settings.run_wszst(file)
                     else:
                         # if file was yaz0 compressed then always yaz0fast compress even if wszst is not set
                         #yaz0.compress_fast(file, data)
-                        data.write(file.getvalue())
+                        filedata = file.getvalue()
                 else:
-                    data.write(file.getvalue()) # Write file data
-                
+                    filedata = file.getvalue() # File data
                 
-                write_uint32(f, data.tell()-filedata_offset) # Write file size
-                write_pad32(data)
-                write_uint32(f, 0)
+                data += filedata
+                filedata_size = len(filedata)
+                data += ZEROS[:-len(data) & 0x1F] # Pad to 32 bytes
+
+                entries.append(FILE_ENTRY.pack(fileid,
+                                               get_hash(filename),
+                                               filemeta.to_flags(),
+                                               0, # padding
+                                               get_string_offset(filename),
+                                               filedata_offset,
+                                               filedata_size,
+                                               0)) # padding
 
                 fileid += 1
 
             specialdirs = [(".", dir), ("..", dir.parent)]
 
             for subdirname, subdir in chain(specialdirs, dir.subdirs.items()):
-                write_uint16(f, 0xFFFF)
-                write_uint16(f, hash_name(subdirname))
-                f.write(b"\x02\x00") # Flag for directory+padding
-                write_uint16(f, stringtable.get_string_offset(subdirname))
-
                 if subdir is None:
                     child_nodeindex = 0xFFFFFFFF
                 else:
                     child_nodeindex = subdir._nodeindex
-                write_uint32(f, child_nodeindex)
-                write_uint32(f, 0x10)
-                write_uint32(f, 0) # Padding
+
+                entries.append(FILE_ENTRY.pack(0xFFFF,
+                                               get_hash(subdirname),
+                                               DIRECTORY,
+                                               0, # padding
+                                               get_string_offset(subdirname),
+                                               child_nodeindex,
+                                               0x10,
+                                               0)) # padding
+
+            f.write(b"".join(entries))
 
         write_pad32(f)
         assert f.tell() % 0x20 == 0
@@ -754,24 +765,27 @@ class Archive(object):
 
         current_data_offset = f.tell()
 
-        f.write(data.getvalue())
+        f.write(data)
 
         rarc_size = f.tell()
 
-        f.seek(4)
-        write_uint32(f, rarc_size)
-        f.seek(12)
-        write_uint32(f, current_data_offset-0x20)
-        write_uint32(f, rarc_size - current_data_offset)
-        write_uint32(f, rarc_size - current_data_offset)
-
-        f.seek(40)
-
         total_file_entries = first_file_entry_index
-        write_uint32(f, total_file_entries)
-        write_uint32(f, current_file_entry_offset-0x20)
-        write_uint32(f, stringtablesize)
-        write_uint32(f, current_stringtable_offset-0x20)
+
+        f.seek(0)
+        f.write(HEADER.pack(b"RARC",
+                            rarc_size,
+                            0x20, # Unknown but often 0x20?
+                            current_data_offset-0x20,
+                            rarc_size - current_data_offset,
+                            rarc_size - current_data_offset,
+                            0, 0, # 2 unknown ints
+                            nodecount,
+                            0x20, # unknown
+                            total_file_entries,
+                            current_file_entry_offset-0x20,
+                            stringtablesize,
+                            current_stringtable_offset-0x20,
+                            0, 0)) # 2 unknown ints
 
 
 
@@ -899,16 +913,16 @@ if __name__ == "__main__":
                 #    f.write(dirpath+"/"+name)
                 #    f.write("\n")
                     
+                lines = []
                 for name in filenames:
                     file = currentdir[name]
-                    f.write(dirpath+"/"+name)
-                    f.write(" ")
-                    f.write(str(file._fileid))
+                    line = f"{dirpath}/{name} {file._fileid}"
                     meta = file.filetype.to_string()
-                    log.debug(f"{hex(file._flags)} {file.filetype.to_string()}")
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug(f"{hex(file._flags)} {meta}")
                     if meta:
-                        f.write(" ")
-                        f.write(meta)
-                    f.write("\n")
+                        line += " " + meta
+                    lines.append(line + "\n")
+                f.writelines(lines)
 
 
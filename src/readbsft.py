@@ -7,11 +7,10 @@ def write_uint32(f, val):
     f.write(struct.pack(">I", val))
 
 def read_string(f):
-    out = b""
-    next = f.read(1)
-    while next != b"\x00":
-        out += next 
-        next = f.read(1)
+    out = bytearray()
+    read = f.read
+    while (next := read(1)) != b"\x00":
+        out.extend(next)
     return str(out, encoding="ascii")
 
 class BSFT(object):
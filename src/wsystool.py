@@ -1,89 +1,299 @@
 """
 A wrapper for the WSYSTool.
 """
-import contextlib
+import concurrent.futures
+import functools
+import hashlib
+import json
+import mmap
 import os
 import pathlib
 import shlex
+import shutil
 import subprocess
-import tempfile
+import sys
+import threading
 import logging
 
 log = logging.getLogger(__name__)
 
+WSYSTOOL_GIT_URL = 'https://github.com/XAYRGA/wsystool.git'
+WSYSTOOL_GIT_SHA = '41a429931734ddf57bb5bbdb7a537148c20e7b3a'
 
-@contextlib.contextmanager
-def _current_directory(dirpath: str):
-    cwd = os.getcwd()
-    try:
-        os.chdir(dirpath)
-        yield
-    finally:
-        os.chdir(cwd)
+_UNPACK_CACHE_MANIFEST_FILENAME = '.mkdd-cache-manifest.json'
+_UNPACK_CACHE_MAX_ENTRIES = 8
+
+# Serializes reads and writes of the unpack cache across the threads of the batch helpers.
+_unpack_cache_lock = threading.Lock()
 
 
+@functools.lru_cache(maxsize=1)
 def _get_wsystool_root() -> str:
     tools_dirpath = str(pathlib.Path(__file__).parent.absolute() / 'tools')
     return os.path.join(tools_dirpath, 'wsystool')
 
 
+@functools.lru_cache(maxsize=1)
 def _get_wsystool_path() -> str:
     ext = '.exe' if os.name == 'nt' else ''
     return os.path.join(_get_wsystool_root(), f'wsystool{ext}')
 
 
+@functools.lru_cache(maxsize=1)
 def check_wsystool() -> bool:
     return os.path.isfile(_get_wsystool_path())
 
 
-def _run(args: list[str]) -> str:
+@functools.lru_cache(maxsize=None)
+def _get_program_path(name: str) -> str:
+    # Resolved once, rather than having the OS search PATH for every invocation.
+    path = shutil.which(name)
+    if path is None:
+        raise RuntimeError(f'"{name}" could not be found. Make sure it is installed and in PATH.')
+    return path
+
+
+@functools.lru_cache(maxsize=1)
+def _get_user_cache_dirpath() -> str:
+    # Per-user location for data that is expensive to recreate but safe to lose.
+    if sys.platform == 'win32':
+        base_dirpath = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base_dirpath = os.path.expanduser('~/Library/Caches')
+    else:
+        base_dirpath = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base_dirpath, 'mkdd-track-patcher')
+
+
+def _get_git_env() -> dict[str, str]:
+    # Fail instead of blocking on a credentials prompt if the repository cannot be reached.
+    return {**os.environ, 'GIT_TERMINAL_PROMPT': '0'}
+
+
+def _get_dotnet_env() -> dict[str, str]:
+    # Skip the first-run experience, banner, and telemetry upload of the .NET CLI, which otherwise
+    # add to the start-up time of every `dotnet` invocation.
+    return {
+        **os.environ,
+        'DOTNET_CLI_TELEMETRY_OPTOUT': '1',
+        'DOTNET_NOLOGO': '1',
+        'DOTNET_SKIP_FIRST_TIME_EXPERIENCE': '1',
+    }
+
+
+def _run(args: list[str], capture: bool = False, **kwargs) -> str | None:
+    # The combined output is always collected (console tools tend to report errors on standard
+    # output), but it is only decoded when the caller needs it or when the command fails.
     try:
-        return subprocess.run(args,
-                              check=True,
-                              stdout=subprocess.PIPE,
-                              stderr=subprocess.STDOUT,
-                              text=True).stdout
+        stdout = subprocess.run(args,
+                                check=True,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT,
+                                **kwargs).stdout
+        return stdout.decode('utf-8', errors='replace') if capture else None
     except subprocess.CalledProcessError as e:
-        command = " ".join([shlex.quote(arg) for arg in e.cmd])
+        command = shlex.join(e.cmd)
+        output = e.output.decode('utf-8', errors='replace')
         raise RuntimeError(f'Command:\n\n{command}\n\n'
                            f'Error code: {e.returncode}\n\n'
-                           f'Output:\n\n{e.output}') from e
+                           f'Output:\n\n{output}') from e
     except Exception as e:
-        command = " ".join([shlex.quote(arg) for arg in args])
+        command = shlex.join(args)
         raise RuntimeError(f'Command:\n\n{command}\n\n'
                            f'Exception type: {type(e).__name__}\n\n'
                            f'Message:\n\n{str(e)}') from e
 
 
 def compile_and_install_wsystool():
-    WSYSTOOL_GIT_URL = 'https://github.com/XAYRGA/wsystool.git'
-    WSYSTOOL_GIT_SHA = '41a429931734ddf57bb5bbdb7a537148c20e7b3a'
-
-    with tempfile.TemporaryDirectory(prefix='mkddpatcher_') as tmp_dir:
-        with _current_directory(tmp_dir):
-            log.info('Checking out WSYSTool...')
-            _run(('git', 'clone', WSYSTOOL_GIT_URL))
-
-            with _current_directory('wsystool'):
-                _run(('git', 'checkout', WSYSTOOL_GIT_SHA))
-
-                log.info('Compiling WSYSTool...')
-                _run((
-                    'dotnet',
-                    'build',
-                    'wsystool.sln',
-                    '--configuration',
-                    'Release',
-                    '--output',
-                    _get_wsystool_root(),
-                ))
+    # The commit that the installed build originates from is recorded next to the binary; if it
+    # matches the pinned commit, there is nothing to rebuild.
+    installed_sha_path = pathlib.Path(_get_wsystool_root()) / '.installed_sha'
+    try:
+        installed_sha = installed_sha_path.read_text(encoding='ascii').strip()
+    except OSError:
+        installed_sha = None
+    if installed_sha == WSYSTOOL_GIT_SHA and check_wsystool():
+        log.info(f'WSYSTool is already installed in "{_get_wsystool_root()}"')
+        return
+
+    # The checkout is kept in the user's cache directory (rather than next to the installed tool,
+    # which is bundled in frozen builds), so that a later rebuild can reuse the Git objects and the
+    # intermediate build files in `obj/`.
+    source_dirpath = os.path.join(_get_user_cache_dirpath(), 'wsystool-src')
+    git = _get_program_path('git')
+    dotnet = _get_program_path('dotnet')
+    git_env = _get_git_env()
 
+    log.info('Checking out WSYSTool...')
+    try:
+        origin_url = _run((git, 'remote', 'get-url', 'origin'),
+                          cwd=source_dirpath,
+                          env=git_env,
+                          capture=True).strip()
+    except RuntimeError:
+        origin_url = None
+    if origin_url != WSYSTOOL_GIT_URL:
+        # Missing, or left incomplete by an interrupted installation; it is set up from scratch.
+        shutil.rmtree(source_dirpath, ignore_errors=True)
+        os.makedirs(source_dirpath, mode=0o700)
+        _run((git, 'init'), cwd=source_dirpath, env=git_env, capture=True)
+        _run((git, 'remote', 'add', 'origin', WSYSTOOL_GIT_URL),
+             cwd=source_dirpath,
+             env=git_env,
+             capture=True)
+
+    # Only the pinned commit is fetched; the rest of the history is not needed for the build.
+    _run((git, 'fetch', '--depth=1', 'origin', WSYSTOOL_GIT_SHA),
+         cwd=source_dirpath,
+         env=git_env,
+         capture=True)
+    _run((git, 'checkout', '--force', 'FETCH_HEAD'),
+         cwd=source_dirpath,
+         env=git_env,
+         capture=True)
+    # Untracked files (other than ignored build outputs) are not part of the pinned commit, and
+    # could otherwise be picked up by the build.
+    _run((git, 'clean', '--force', '-d'), cwd=source_dirpath, env=git_env, capture=True)
+
+    log.info('Compiling WSYSTool...')
+    _run((
+        dotnet,
+        'build',
+        'wsystool.sln',
+        '--configuration',
+        'Release',
+        '--output',
+        _get_wsystool_root(),
+    ), cwd=source_dirpath, env=_get_dotnet_env(), capture=True)
+
+    installed_sha_path.write_text(WSYSTOOL_GIT_SHA, encoding='ascii')
+
+    # The installation state is cached; a fresh check is needed now that the tool has been built.
+    check_wsystool.cache_clear()
     assert check_wsystool(), 'Tool should be available after successful installation'
 
     log.info(f'WSYSTool installed successfully in "{_get_wsystool_root()}"')
 
 
-def unpack_wsys(src_filepath: str, dst_dirpath, awpath: str, export_waves: bool):
+def _check_paths(filepaths: tuple[str, ...] = (), dirpaths: tuple[str, ...] = ()):
+    # Missing inputs are reported before paying for the start-up of the .NET tool.
+    for filepath in filepaths:
+        if not os.path.isfile(filepath):
+            raise FileNotFoundError(f'File "{filepath}" does not exist')
+    for dirpath in dirpaths:
+        if not os.path.isdir(dirpath):
+            raise FileNotFoundError(f'Directory "{dirpath}" does not exist')
+
+
+def _hash_file(filepath: str) -> bytes:
+    with open(filepath, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return hashlib.sha256().digest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return hashlib.sha256(buf).digest()
+
+
+def _get_aw_digest(awpath: str) -> bytes:
+    digest = hashlib.sha256()
+    for filename in sorted(os.listdir(awpath)):
+        filepath = os.path.join(awpath, filename)
+        if os.path.isfile(filepath):
+            digest.update(filename.encode('utf-8'))
+            digest.update(_hash_file(filepath))
+    return digest.digest()
+
+
+def _get_unpack_cache_dirpath() -> str:
+    return os.path.join(_get_user_cache_dirpath(), 'wsys-cache')
+
+
+def _list_directory_files(dirpath: str) -> list[tuple[str, int]]:
+    files = []
+    for root, _dirnames, filenames in os.walk(dirpath):
+        for filename in filenames:
+            filepath = os.path.join(root, filename)
+            relpath = os.path.relpath(filepath, dirpath).replace(os.sep, '/')
+            files.append((relpath, os.path.getsize(filepath)))
+    return sorted(files)
+
+
+def _is_unpack_cache_entry_valid(entry_dirpath: str) -> bool:
+    # Temporary file cleaners and the like may have removed some of the files in the entry; only
+    # an entry that still matches its manifest is used.
+    try:
+        with open(os.path.join(entry_dirpath, _UNPACK_CACHE_MANIFEST_FILENAME),
+                  'r',
+                  encoding='utf-8') as f:
+            manifest = [tuple(item) for item in json.load(f)]
+        files = _list_directory_files(entry_dirpath)
+    except (OSError, ValueError, TypeError):
+        return False
+    files = [item for item in files if item[0] != _UNPACK_CACHE_MANIFEST_FILENAME]
+    return files == manifest
+
+
+def _store_unpack_cache_entry(src_dirpath: str, entry_dirpath: str):
+    # The entry is populated under a placeholder name first, so that an interrupted copy is never
+    # mistaken for a valid entry.
+    placeholder_dirpath = f'{entry_dirpath}-placeholder'
+    shutil.rmtree(placeholder_dirpath, ignore_errors=True)
+    shutil.rmtree(entry_dirpath, ignore_errors=True)
+    shutil.copytree(src_dirpath, placeholder_dirpath)
+    with open(os.path.join(placeholder_dirpath, _UNPACK_CACHE_MANIFEST_FILENAME),
+              'w',
+              encoding='utf-8') as f:
+        json.dump(_list_directory_files(src_dirpath), f)
+    try:
+        os.rename(placeholder_dirpath, entry_dirpath)
+    except OSError:
+        shutil.rmtree(placeholder_dirpath, ignore_errors=True)
+
+
+def _prune_unpack_cache():
+    # Only the most recently used entries are kept.
+    cache_dirpath = _get_unpack_cache_dirpath()
+    entries = []
+    for entry in os.scandir(cache_dirpath):
+        if entry.is_dir() and not entry.name.endswith('-placeholder'):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue  # Removed in the meantime (e.g. by another process).
+    entries.sort(reverse=True)
+    for _mtime, entry_dirpath in entries[_UNPACK_CACHE_MAX_ENTRIES:]:
+        shutil.rmtree(entry_dirpath, ignore_errors=True)
+
+
+def _unpack_wsys(src_filepath: str,
+                 dst_dirpath,
+                 awpath: str,
+                 export_waves: bool,
+                 aw_digest: bytes | None = None):
+    _check_paths(filepaths=(src_filepath, ), dirpaths=(awpath, ))
+
+    # Unpacking the same WSYS and AW files yields the same directory, so results are cached in the
+    # user's cache directory, keyed by the digest of the inputs. Exporting the waves only happens
+    # on the first run, so those (larger) results are not cached.
+    entry_dirpath = None
+    if not export_waves:
+        digest = hashlib.sha256()
+        digest.update(WSYSTOOL_GIT_SHA.encode('ascii'))
+        digest.update(aw_digest if aw_digest is not None else _get_aw_digest(awpath))
+        digest.update(_hash_file(src_filepath))
+        entry_dirpath = os.path.join(_get_unpack_cache_dirpath(), digest.hexdigest())
+        with _unpack_cache_lock:
+            if _is_unpack_cache_entry_valid(entry_dirpath):
+                # The cache is only an optimization; if it cannot be used, WSYSTool is run instead.
+                try:
+                    shutil.copytree(entry_dirpath,
+                                    dst_dirpath,
+                                    ignore=shutil.ignore_patterns(_UNPACK_CACHE_MANIFEST_FILENAME),
+                                    dirs_exist_ok=True)
+                    os.utime(entry_dirpath)  # Marks the entry as recently used.
+                    return
+                except OSError as e:
+                    log.warning(f'Unable to use cached unpack of "{src_filepath}": {e}')
+
     args = [
         _get_wsystool_path(),
         'unpack',
@@ -99,8 +309,23 @@ def unpack_wsys(src_filepath: str, dst_dirpath, awpath: str, export_waves: bool)
         ])
     _run(args)
 
+    if entry_dirpath is not None:
+        # The archive has been unpacked by now; failing to cache the result is not an error.
+        try:
+            with _unpack_cache_lock:
+                os.makedirs(_get_unpack_cache_dirpath(), mode=0o700, exist_ok=True)
+                _store_unpack_cache_entry(dst_dirpath, entry_dirpath)
+                _prune_unpack_cache()
+        except OSError as e:
+            log.warning(f'Unable to cache unpack of "{src_filepath}": {e}')
+
+
+def unpack_wsys(src_filepath: str, dst_dirpath, awpath: str, export_waves: bool):
+    _unpack_wsys(src_filepath, dst_dirpath, awpath, export_waves)
+
 
 def pack_wsys(src_dirpath: str, dst_filepath: str, awpath: str):
+    _check_paths(dirpaths=(src_dirpath, awpath))
     _run((
         _get_wsystool_path(),
         'pack',
@@ -109,3 +334,29 @@ def pack_wsys(src_dirpath: str, dst_filepath: str, awpath: str):
         '-awpath',
         awpath,
     ))
+
+
+def _run_batch(func, jobs: list[tuple]):
+    if not jobs:
+        return
+    # The work happens in the WSYSTool processes; threads suffice to keep several of them running.
+    max_workers = min(len(jobs), os.cpu_count() or 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(func, *job) for job in jobs]
+        for future in futures:
+            future.result()
+
+
+def unpack_wsys_batch(jobs: list[tuple[str, str, str, bool]]):
+    # The jobs typically share the AW directory, which is hashed only once, up front. Jobs that
+    # export the waves are not cached, and need no digest.
+    aw_digests = {}
+    for _src_filepath, _dst_dirpath, awpath, export_waves in jobs:
+        if not export_waves and awpath not in aw_digests:
+            _check_paths(dirpaths=(awpath, ))
+            aw_digests[awpath] = _get_aw_digest(awpath)
+    _run_batch(_unpack_wsys, [job + (aw_digests.get(job[2]), ) for job in jobs])
+
+
+def pack_wsys_batch(jobs: list[tuple[str, str, str]]):
+    _run_batch(pack_wsys, jobs)
@@ -5,7 +5,6 @@
 
 import os
 import re
-import math
 import hashlib
 import logging
 
@@ -119,15 +118,10 @@ def decompress(f, out, suppress_error=False):
                 if copy_length < bytecount:
                     # Copy source and copy distance overlap which essentially means that
                     # we have to repeat the copied source to make up for the difference
-                    j = 0
-                    for i in range(bytecount-copy_length):
-                        #write_limited(out, copy[j:j+1], decompressed_size)
-                        if out_tell() < decompressed_size:
-                            out_write(copy[j:j+1])
-                        else:
-                            break
-
-                        j = (j+1) % copy_length
+                    repeat_length = min(bytecount-copy_length, decompressed_size-out_tell())
+                    if repeat_length > 0:
+                        repeats = repeat_length//copy_length + 1
+                        out_write((copy*repeats)[:repeat_length])
                 
     if out.tell() < decompressed_size:
         log.debug("this isn't right")
@@ -146,18 +140,13 @@ def compress_fast(f, out):
     out.write(pack(">I", maxsize))
     out.write(b"\x00"*8)
 
-    out_write = out.write
     log.info(f"size: {hex(maxsize)}")
     log.info(maxsize//8, maxsize/8.0)
-    for i in range(int(math.ceil(maxsize/8))):
-        start = i*8 
-        end = (i+1)*8
-        if end > maxsize:
-            # Pad data with 0's up to 8 bytes
-            tocopy = data[start:maxsize] + b"\x00"*(end-maxsize)
-            log.info("Padded")
-        else:
-            tocopy = data[start:end]
-        
-        out_write(b"\xFF") # Set all bits in the code byte to 1 to mark the following 8 bytes as copy
-        out_write(tocopy)
+    if maxsize % 8:
+        # Pad data with 0's up to 8 bytes
+        data += b"\x00"*(8 - maxsize % 8)
+        log.info("Padded")
+
+    # Set all bits in the code byte to 1 to mark the following 8 bytes as copy.
+    # The whole stream is built in one go rather than with two writes per 8 bytes.
+    out.write(b"".join([b"\xFF" + data[start:start+8] for start in range(0, len(data), 8)]))